@@ -1,12 +1,15 @@
 import argparse
+import gzip
+import os
 import re
 import stat
 import tarfile
 import time
+from contextlib import contextmanager
 from enum import Enum
 from io import BytesIO
 from pathlib import Path
-from typing import BinaryIO
+from typing import BinaryIO, Callable, Iterator, Optional
 
 __version__ = "0.0.1"
 
@@ -29,8 +32,13 @@ class Dm(object):
         destination: str,
         compression: CompressionType = CompressionType.GZIP,
         compression_level: int = 9,
+        source_date_epoch: Optional[int] = None,
     ) -> None:
-        """Build a deb file from the contents of the provided directory, using the specifed compression algorithm"""
+        """Build a deb file from the contents of the provided directory, using the specifed compression algorithm
+
+        If source_date_epoch is provided, the package is built reproducibly: all timestamps are clamped to it,
+        ownership is normalized to root and compressor timestamps are zeroed, so identical inputs produce identical bytes
+        """
 
         in_path = Path(in_directory)
 
@@ -38,31 +46,33 @@ class Dm(object):
         debian_bin = BytesIO(b"2.0")
 
         # Build the control archive
-        control_tar = Dm._build_control_archive(in_path)
+        control_tar = Dm._build_control_archive(in_path, source_date_epoch)
 
         # Build the data archive
-        data_archive = Dm._build_data_archive(in_path, compression, compression_level)
+        data_archive = Dm._build_data_archive(in_path, compression, compression_level, source_date_epoch)
 
         # Build the deb file
         with open(destination, mode="wb") as debf:
             # Magic bytes
             debf.write(b"!<arch>\n")
             # Add files
-            Dm._add_file_to_archive("debian-binary", debian_bin, debf)
-            Dm._add_file_to_archive("control.tar.gz", control_tar, debf)
+            Dm._add_file_to_archive("debian-binary", debian_bin, debf, source_date_epoch)
+            Dm._add_file_to_archive("control.tar.gz", control_tar, debf, source_date_epoch)
             # Data archive suffix depends on compression type
             data_archive_name = f"data.tar.{compression.value}"
-            Dm._add_file_to_archive(data_archive_name, data_archive, debf)
+            Dm._add_file_to_archive(data_archive_name, data_archive, debf, source_date_epoch)
 
     @classmethod
-    def _add_file_to_archive(cls, name: str, data: BytesIO, archive: BinaryIO) -> None:
+    def _add_file_to_archive(cls, name: str, data: BytesIO, archive: BinaryIO, mtime: Optional[int] = None) -> None:
         """Add a file into an AR archive"""
         # Write the file name
         filename = name.ljust(16, " ").encode("utf-8")
         archive.write(filename)
 
-        # File timestamp - use current time
-        timestamp = str(int(time.time())).ljust(12, " ").encode("utf-8")
+        # File timestamp - use the provided time, falling back to the current time
+        if mtime is None:
+            mtime = int(time.time())
+        timestamp = str(mtime).ljust(12, " ").encode("utf-8")
         archive.write(timestamp)
 
         # UID and GID (both 0)
@@ -89,7 +99,47 @@ class Dm(object):
             archive.write(b"\n")
 
     @classmethod
-    def _build_control_archive(cls, directory: Path) -> BytesIO:
+    @contextmanager
+    def _open_tar(
+        cls,
+        fileobj: BytesIO,
+        compression: CompressionType,
+        compression_level: int = 9,
+        source_date_epoch: Optional[int] = None,
+    ) -> Iterator[tarfile.TarFile]:
+        """Open a compressed tarball for writing"""
+        if compression is not CompressionType.GZIP:
+            # LZMA uses a different name for "compression level" (wtf). "preset" for lzma, 'compresslevel" for everything else
+            compression_argname = "preset" if compression is CompressionType.LZMA else "compresslevel"
+            tarmode = f"w:{compression.value}"
+            with tarfile.open(fileobj=fileobj, mode=tarmode, **{compression_argname: compression_level}) as tarf:  # type: ignore
+                yield tarf
+            return
+
+        # tarfile doesn't expose the gzip header timestamp, so the gzip stream is created here.
+        # Reproducible builds zero it, otherwise the current time is used
+        gzip_mtime = None if source_date_epoch is None else 0
+        with gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=compression_level, mtime=gzip_mtime) as gzf:
+            with tarfile.open(fileobj=gzf, mode="w") as tarf:  # type: ignore
+                yield tarf
+
+    @classmethod
+    def _tarinfo_filter(cls, source_date_epoch: Optional[int]) -> Optional[Callable[[tarfile.TarInfo], tarfile.TarInfo]]:
+        """Build a tarfile filter that normalizes entry metadata for reproducible builds"""
+        if source_date_epoch is None:
+            return None
+
+        def _normalize(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+            # Clamp timestamps to the source date, and don't leak the build machine's users
+            tarinfo.mtime = min(int(tarinfo.mtime), source_date_epoch)
+            tarinfo.uid = tarinfo.gid = 0
+            tarinfo.uname = tarinfo.gname = "root"
+            return tarinfo
+
+        return _normalize
+
+    @classmethod
+    def _build_control_archive(cls, directory: Path, source_date_epoch: Optional[int] = None) -> BytesIO:
         """Compress the control archive (DEBIAN) into a gzipped tarball"""
         # There needs to be a directory called DEBIAN in the root of the provided path
         control_directory = directory / "DEBIAN"
@@ -103,8 +153,10 @@ class Dm(object):
 
         # Build the archive
         control_tar = BytesIO()
-        with tarfile.open(fileobj=control_tar, mode="w:gz") as tarf:
-            for f in control_directory.iterdir():
+        tar_filter = cls._tarinfo_filter(source_date_epoch)
+        with cls._open_tar(control_tar, CompressionType.GZIP, source_date_epoch=source_date_epoch) as tarf:
+            # Sort entries so the archive doesn't depend on filesystem ordering
+            for f in sorted(control_directory.iterdir()):
                 # Skip .DS_Store files generated by macOS
                 if f.name == ".DS_Store":
                     continue
@@ -117,7 +169,7 @@ class Dm(object):
                     )
 
                 # Add the files to the root of the archive
-                tarf.add(f.as_posix(), arcname=f.name)
+                tarf.add(f.as_posix(), arcname=f.name, filter=tar_filter)
 
         # Parse the control file. This happens after the permissions checks, because doing this requires the ability to read the file.
         # If the file cannot be read, the desired exception is invalid file permissions
@@ -151,14 +203,19 @@ class Dm(object):
             raise Exception(f"Package version {control_data['version']} doesn't contain any digits.")
 
     @classmethod
-    def _build_data_archive(cls, directory: Path, compression: CompressionType, compression_level: int = 9) -> BytesIO:
+    def _build_data_archive(
+        cls,
+        directory: Path,
+        compression: CompressionType,
+        compression_level: int = 9,
+        source_date_epoch: Optional[int] = None,
+    ) -> BytesIO:
         """Compress the package's files"""
         data_archive = BytesIO()
-        # LZMA uses a different name for "compression level" (wtf). "preset" for lzma, 'compresslevel" for everything else
-        compression_argname = "preset" if compression is CompressionType.LZMA else "compresslevel"
-        tarmode = f"w:{compression.value}"
-        with tarfile.open(fileobj=data_archive, mode=tarmode, **{compression_argname: compression_level}) as tarf:  # type: ignore
-            for f in directory.glob("**/*"):
+        tar_filter = cls._tarinfo_filter(source_date_epoch)
+        with cls._open_tar(data_archive, compression, compression_level, source_date_epoch) as tarf:
+            # Sort entries so the archive doesn't depend on filesystem ordering
+            for f in sorted(directory.glob("**/*")):
                 # Exclude all directories and anything within DEBIAN/
                 if f.is_dir() or f.parent.name == "DEBIAN":
                     continue
@@ -169,7 +226,7 @@ class Dm(object):
 
                 # Add the file to the archive, using a path relative to the input directory
                 relative_path = f.relative_to(directory)
-                tarf.add(f.as_posix(), arcname=f"/{relative_path.as_posix()}")
+                tarf.add(f.as_posix(), arcname=f"/{relative_path.as_posix()}", filter=tar_filter)
         return data_archive
 
 
@@ -197,9 +254,15 @@ if __name__ == "__main__":
         "bz2": CompressionType.BZIP2,
     }[parsed_args.compression]
 
+    # Build reproducibly when SOURCE_DATE_EPOCH is set, like dpkg-deb
+    # https://reproducible-builds.org/specs/source-date-epoch/
+    source_date_epoch_env = os.environ.get("SOURCE_DATE_EPOCH")
+    source_date_epoch = int(source_date_epoch_env) if source_date_epoch_env else None
+
     Dm.build_package(
         in_directory=parsed_args.directory,
         destination=parsed_args.package,
         compression=compression_type,
         compression_level=parsed_args.compresslevel,
+        source_date_epoch=source_date_epoch,
     )
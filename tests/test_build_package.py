@@ -1,3 +1,5 @@
+import hashlib
+import os
 import tempfile
 import time
 from io import BytesIO
@@ -212,3 +214,44 @@ class TestDmPackage:
         # And the file data is correct
         # And the file contains the "odd bytes" padding
         assert data[60:] == b"test12345\n"
+
+    def test_build_package__reproducible(self) -> None:
+        package_hashes = []
+        # Given the same package tree staged twice, with different file mtimes and creation order
+        for mtime, fnames in [(1700000000, ["b_file", "a_file"]), (1800000000, ["a_file", "b_file"])]:
+            with tempfile.TemporaryDirectory() as tempdir:
+                staging = Path(tempdir) / "staging"
+                staging.mkdir()
+                debian_dir = staging / "DEBIAN"
+                debian_dir.mkdir()
+                control_file = debian_dir / "control"
+                control_file.write_bytes(b"Package: com.test\nVersion: 1.0\nArchitecture: arm64")
+                for fname in fnames:
+                    some_file = staging / fname
+                    some_file.write_bytes(b"1234567890")
+                    os.utime(some_file, (mtime, mtime))
+
+                # When I build a deb with a source date epoch
+                destination = Path(tempdir) / "test.deb"
+                Dm.build_package(staging.as_posix(), destination.as_posix(), source_date_epoch=1600000000)
+                package_hashes.append(hashlib.sha256(destination.read_bytes()).hexdigest())
+
+            # Across separate seconds, so the wall clock would show up in the output
+            time.sleep(1)
+
+        # Both packages are byte-identical
+        assert package_hashes[0] == package_hashes[1]
+
+    def test__add_file_to_archive__mtime(self) -> None:
+        # Given a file with some test data
+        test_file = BytesIO(b"test1234")
+
+        # And an ar archive
+        ar_archive = BytesIO()
+
+        # When the file is added to the archive with an explicit mtime
+        Dm._add_file_to_archive("testfile", test_file, ar_archive, 1600000000)
+
+        # The timestamp is the provided mtime
+        data = ar_archive.getvalue()
+        assert int(data[16:28]) == 1600000000
@@ -1,3 +1,4 @@
+import os
 import tarfile
 import tempfile
 from pathlib import Path
@@ -109,3 +110,30 @@ class TestDataArchive:
                 assert "test1" in tarf.getnames()
                 assert "test2" in tarf.getnames()
                 assert "test3" in tarf.getnames()
+
+    def test_build_data_archive__reproducible(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            staging = Path(tempdir)
+            # Given some test files, one newer than the source date epoch
+            for fname, mtime in [("test1", 1500000000), ("test2", 1700000000)]:
+                f = staging / fname
+                f.write_bytes(b"file data 123")
+                os.utime(f, (mtime, mtime))
+
+            # When a gzip data archive is created with a source date epoch
+            data_archive = Dm._build_data_archive(staging, CompressionType.GZIP, 9, source_date_epoch=1600000000)
+
+            # The gzip header timestamp is zeroed
+            assert data_archive.getvalue()[4:8] == b"\x00\x00\x00\x00"
+
+            # When the archive is decompressed
+            data_archive.seek(0)
+            with tarfile.open(fileobj=data_archive, mode="r:gz") as tarf:
+                # Newer mtimes are clamped to the source date epoch, older ones are kept
+                assert tarf.getmember("test1").mtime == 1500000000
+                assert tarf.getmember("test2").mtime == 1600000000
+
+                # And ownership is normalized to root
+                for member in tarf.getmembers():
+                    assert member.uid == 0 and member.gid == 0
+                    assert member.uname == "root" and member.gname == "root"